@@ -1,9 +1,16 @@
+import asyncio
+import functools
 import logging
 import re
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
-from bs4 import BeautifulSoup, NavigableString
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import ParserRejectedMarkup
+from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import scaruffi.log
 
@@ -11,10 +18,99 @@ import scaruffi.log
 SITE_URL = "https://scaruffi.com"
 GENERAL_INDEX = SITE_URL + "/music/groups.html"
 RATINGS_DECADES = SITE_URL + "/ratings/{:02}.html"
+HTTP_TIMEOUT = 10
+MAX_WORKERS = 6
+PAGE_CACHE_SIZE = 64
 
+# Data is always in tables, so the rest of the page is not worth a tree.
+_TABLES_ONLY = SoupStrainer("table")
 
-@dataclass
-class Release:
+# Shared by all API instances so connections to the site are kept alive.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+))
+
+
+@functools.lru_cache(maxsize=PAGE_CACHE_SIZE)
+def _fetch_page(url):
+    """Return the page text at url, raising on any error.
+
+    Results are cached; errors are raised instead of returned so that they
+    are never cached and a later call can try again.
+    """
+    response = _SESSION.get(url, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(response=response)
+    return response.text
+
+
+def _soup_text_len(tag):
+    """Length of the text in a BS4 tag, without building the text."""
+    return sum(len(text) for text in tag.strings)
+
+
+class _FattestTableLinks:
+    """lxml parser target returning the link texts of the fattest table.
+
+    The fattest table is the one with the most text, including the text of
+    nested tables; on ties, the first opened one wins. No tree is built: only
+    the open tables and the links of each are kept while parsing.
+    """
+
+    def __init__(self):
+        self.open_tables = []  # [text length, -start index, link texts]
+        self.num_tables = 0
+        self.best = None
+        self.link_depth = 0
+        self.link_text = []
+
+    def start(self, tag, attrib):
+        if tag == "table":
+            self.open_tables.append([0, -self.num_tables, []])
+            self.num_tables += 1
+        elif tag == "a":
+            self.link_depth += 1
+
+    def end(self, tag):
+        if tag == "table" and self.open_tables:
+            table = self.open_tables.pop()
+            if self.best is None or table[:2] > self.best[:2]:
+                self.best = table
+        elif tag == "a" and self.link_depth:
+            self.link_depth -= 1
+            if not self.link_depth:
+                text = "".join(self.link_text)
+                self.link_text = []
+                for table in self.open_tables:
+                    table[2].append(text)
+
+    def data(self, data):
+        for table in self.open_tables:
+            table[0] += len(data)
+        if self.link_depth:
+            self.link_text.append(data)
+
+    def close(self):
+        return self.best[2] if self.best else None
+
+
+@functools.lru_cache(maxsize=1)
+def _parse_musicians(html):
+    """Return a tuple of the musicians in the index page, or None.
+
+    Pages come from the page cache as the same string objects, so repeated
+    lookups for paginated queries are cheap and skip parsing entirely.
+    """
+    parser = etree.HTMLParser(target=_FattestTableLinks())
+    parser.feed(html)
+    musicians = parser.close()
+    return tuple(musicians) if musicians is not None else None
+
+
+class Release(NamedTuple):
     title: str
     artist: str = ""
     year: int = 0  # Usually the release year, not the recording year.
@@ -26,33 +122,41 @@ class ScaruffiApi:
         self.log = scaruffi.log.get_logger("scaruffi", level=log_level)
 
     def _get_soup(self, url):
-        html = self._get_page(url)
+        return self._make_soup(self._get_page(url), url)
+
+    def _make_soup(self, html, url):
+        """Parse the tables of this HTML page; the rest is not kept."""
         if not html:
             return None
-        return BeautifulSoup(html, "html5lib")
+        try:
+            return BeautifulSoup(html, "lxml", parse_only=_TABLES_ONLY)
+        except ParserRejectedMarkup:
+            self.log.warning(f"lxml rejected {url}, falling back to html5lib.")
+            # html5lib does not support parse_only, it builds the whole tree.
+            return BeautifulSoup(html, "html5lib")
 
     def _get_page(self, url):
         self.log.debug(f"GET {url}")
         try:
-            response = requests.get(url)
+            return _fetch_page(url)
+        except requests.exceptions.HTTPError as exc:
+            sc = exc.response.status_code
+            self.log.error(f"Server returned HTTP response {sc} to {url}.")
         except requests.exceptions.RequestException as exc:
             self.log.error(f"An exception occured during HTTP GET: {exc}")
-            return None
-        sc = response.status_code
-        if sc != 200:
-            self.log.error(f"Server returned HTTP response {sc} to {url}.")
-            return None
-        return response.text
+        return None
 
     def get_musicians(self, offset=0, limit=20):
         """Get a list of musicians, or None on error."""
-        soup = self._get_soup(GENERAL_INDEX)
-        if not soup:
+        html = self._get_page(GENERAL_INDEX)
+        if not html:
             return None
         # Semantic Web? Just find the fattest table.
-        mu_table = max(soup.find_all("table"), key=lambda t: len(t.text))
-        musicians = [a_tag.text for a_tag in mu_table.find_all("a")]
-        return musicians[offset : offset + limit]
+        musicians = _parse_musicians(html)
+        if musicians is None:
+            self.log.error("No table found in musicians page.")
+            return None
+        return list(musicians[offset : offset + limit])
 
     def get_ratings(self, decade):
         """Get a dict of ratings to a release list for this decade.
@@ -60,15 +164,64 @@ class ScaruffiApi:
         The decade must be an integer in the [0, 99] range, or a full year
         (1960 for example). Returns None on error.
         """
+        url = self._get_ratings_url(decade)
+        if not url:
+            return None
+        return self._parse_ratings(self._get_soup(url))
+
+    def get_ratings_many(self, decades):
+        """Get ratings for several decades, downloading pages concurrently.
+
+        Returns a dict of each decade to what get_ratings would return for it.
+        """
+        decades = list(decades)
+        urls = [self._get_ratings_url(decade) for decade in decades]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            pages = list(executor.map(
+                lambda url: self._get_page(url) if url else None,
+                urls
+            ))
+        # Parsing is CPU-bound, keep it out of the pool.
+        return {
+            decade: self._parse_ratings(self._make_soup(page, url))
+            for decade, url, page in zip(decades, urls, pages)
+        }
+
+    async def aget_ratings_many(self, decades):
+        """Coroutine version of get_ratings_many, for asyncio programs.
+
+        Each decade is fetched and parsed in the loop's default executor, so
+        the event loop is never blocked by the crawl.
+        """
+        decades = list(decades)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(None, self.get_ratings, decade)
+            for decade in decades
+        ))
+        return dict(zip(decades, results))
+
+    def _get_ratings_url(self, decade):
+        """Get the ratings page URL for this decade, or None if invalid."""
         if 1900 <= decade:
             decade %= 100
         if not (0 <= decade < 100 and decade % 10 == 0):
             self.log.error(f"Invalid decade value: {decade}.")
             return None
-        soup = self._get_soup(RATINGS_DECADES.format(decade))
+        return RATINGS_DECADES.format(decade)
+
+    def _parse_ratings(self, soup):
+        """Get ratings from a decade page soup, or None on error."""
         if not soup:
             return None
-        ratings_table = max(soup.find_all("table"), key=lambda t: len(t.text))
+        # A nested table never has more text than the table around it, so only
+        # outermost tables need measuring; they are at the top of a strained
+        # soup. The html5lib fallback soup is complete, so search it all.
+        tables = (
+            soup.find_all("table", recursive=False)
+            or soup.find_all("table")
+        )
+        ratings_table = max(tables, key=_soup_text_len)
         lists = ratings_table("ul")
         if len(lists) == 1:
             return self._get_ratings_from_unique_list(lists[0])
@@ -80,20 +233,22 @@ class ScaruffiApi:
         ratings = {}
         current_key = None
         for tag in messy_list:
-            if isinstance(tag, NavigableString):
+            name = tag.name
+            if not name:  # Strings have no name.
                 continue
+            tag_text = tag.get_text()  # Not cached by BS4, get it once.
             # Get an entry for the current rating.
-            if tag.name == "li":
-                release = self._parse_release(tag.text)
+            if name == "li":
+                release = self._parse_release(tag_text)
                 if not current_key:
                     self.log.critical(f"Release {release} without rating.")
                     return None
                 ratings[current_key].append(release)
             # Detect a new rating list.
             # Do it after getting entries in tag due to bad HTML.
-            text = tag.text.strip()
+            text = tag_text.strip()
             if text:
-                rating = self._match_rating(text.split()[-1])
+                rating = self._match_rating(text.rsplit(None, 1)[-1])
                 if rating is not None:
                     current_key = rating
                     ratings[current_key] = []
@@ -129,21 +284,22 @@ class ScaruffiApi:
                 ratings[rating].append(release)
         return ratings
 
-    RATING_RE = re.compile(r"\s*(\d(.\d)?)/10\s*")
+    RATING_RE = re.compile(r"(\d(?:\.\d)?)/10")
 
     def _match_rating(self, text):
         """Try to match text as a rating and return the rating, or None."""
-        if not text.strip():
+        text = text.strip()
+        if not text:
             return None
-        match = self.RATING_RE.match(text.strip())
+        match = self.RATING_RE.match(text)
         if match:
             return float(match.group(1))
 
     def _parse_release(self, entry):
         """Fill a release fields using entry, as well as we can."""
         entry = entry.strip("\r\n :")  # Remove bogus spaces and colons.
-        parts = entry.split(": ")
-        if len(parts) == 1:
+        artist, sep, rest = entry.partition(": ")
+        if not sep:
             self.log.info(f"No colon in {entry}, using both as artist & title.")
             title_and_year = self._parse_release_title_year(entry)
             if not title_and_year:
@@ -151,13 +307,10 @@ class ScaruffiApi:
             title, year = title_and_year
             artist = title
         else:
-            # Usual case is 2 parts ("artist: title"), but in case one of them
-            # contains ": " as well, assume that it is part of the title, not
-            # the artist name.
-            artist = parts[0]
-            title_and_year_str = parts[1].strip()
-            if len(parts) > 2:
-                title_and_year_str += ": " + ": ".join(parts[2:])
+            # Usual case is "artist: title", but in case one of them contains
+            # ": " as well, assume that it is part of the title, not the artist
+            # name: partition only splits on the first one.
+            title_and_year_str = rest.strip()
             title_and_year = self._parse_release_title_year(title_and_year_str)
             if not title_and_year:
                 return Release(artist=artist, title=title_and_year_str)
@@ -1,13 +1,18 @@
+import asyncio
 import logging
 import unittest
+from unittest import mock
 
-from scaruffi.api import ScaruffiApi
+from scaruffi import api
+from scaruffi.api import Release, ScaruffiApi, _parse_musicians
 
 
 class TestScaruffi(unittest.TestCase):
 
     def setUp(self):
         self.api = ScaruffiApi()
+        _parse_musicians.cache_clear()
+        api._fetch_page.cache_clear()
 
     def tearDown(self):
         self.api = None
@@ -16,6 +21,22 @@ class TestScaruffi(unittest.TestCase):
         musicians = self.api.get_musicians()
         self.assertEqual(len(musicians), 20)
 
+    def test_get_musicians_pages(self):
+        musicians = self.api.get_musicians(offset=0, limit=10)
+        next_musicians = self.api.get_musicians(offset=5, limit=5)
+        self.assertEqual(next_musicians, musicians[5:])
+
+    def test_get_page_errors_not_cached(self):
+        responses = [
+            mock.Mock(status_code=500),
+            mock.Mock(status_code=200, text="page"),
+        ]
+        with mock.patch.object(api._SESSION, "get", side_effect=responses):
+            self.assertIsNone(self.api._get_page("https://example.com"))
+            self.assertEqual(self.api._get_page("https://example.com"), "page")
+            # Now cached, no more requests are made.
+            self.assertEqual(self.api._get_page("https://example.com"), "page")
+
     def test_get_ratings(self):
         self.assertIsNotNone(self.api.get_ratings(1960))
         self.assertIsNotNone(self.api.get_ratings(1970))
@@ -23,3 +44,56 @@ class TestScaruffi(unittest.TestCase):
         self.assertIsNotNone(self.api.get_ratings(1990))
         self.assertIsNotNone(self.api.get_ratings(2000))
         self.assertIsNotNone(self.api.get_ratings(2010))
+
+    def test_get_ratings_many(self):
+        decades = [1960, 1970, 1980, 1990, 2000, 2010]
+        ratings = self.api.get_ratings_many(decades)
+        self.assertEqual(list(ratings), decades)
+        for decade_ratings in ratings.values():
+            self.assertIsNotNone(decade_ratings)
+
+    def test_aget_ratings_many(self):
+        decades = [1960, 1970]
+        ratings = asyncio.run(self.api.aget_ratings_many(decades))
+        self.assertEqual(list(ratings), decades)
+        for decade_ratings in ratings.values():
+            self.assertIsNotNone(decade_ratings)
+
+    def test_parse_release(self):
+        release = Release(
+            title="Trout Mask Replica",
+            artist="Captain Beefheart",
+            year=1969
+        )
+        entry = "Captain Beefheart: Trout Mask Replica (1969)"
+        self.assertEqual(self.api._parse_release(entry), release)
+        self.assertEqual(
+            self.api._parse_release("Someone: Foo: Bar (1967-68)\n"),
+            Release(title="Foo: Bar", artist="Someone", year=1967)
+        )
+
+    def test_parse_musicians(self):
+        # Links of the fattest table, nested tables included, in order.
+        html = (
+            "<table><tr><td><a>Nav</a></td></tr></table>"
+            "<table><tr><td><a>A</a> some text"
+            "<table><tr><td><a>B</a></td></tr></table>"
+            "<a>C <b>D</b></a></td></tr></table>"
+        )
+        self.assertEqual(_parse_musicians(html), ("A", "B", "C D"))
+        # A nested table as fat as its parent does not win over it.
+        html = "<table><tr><td><table><tr><td><a>X</a></td></tr></table>"
+        html += "</td></tr></table>"
+        self.assertEqual(_parse_musicians(html), ("X",))
+        # On ties, the first table wins.
+        html = "<table><td><a>1</a></td></table>"
+        html += "<table><td><a>2</a></td></table>"
+        self.assertEqual(_parse_musicians(html), ("1",))
+        # Unclosed tags are closed by the parser.
+        html = "<table><tr><td><a>E</a><a>F"
+        self.assertEqual(_parse_musicians(html), ("E", "F"))
+        # Declared encodings in str pages are ignored.
+        html = '<?xml version="1.0" encoding="iso-8859-1"?>'
+        html += "<table><tr><td><a>G</a></td></tr></table>"
+        self.assertEqual(_parse_musicians(html), ("G",))
+        self.assertIsNone(_parse_musicians("<p><a>No table</a></p>"))